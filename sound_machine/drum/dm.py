@@ -1,7 +1,15 @@
 #!/usr/bin/env python
 
+import os
+import sys
+import time
 import pygame
 import random
+import numpy as np
+
+# The recorder lives next to the synth
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'synth'))
+from recorder import Recorder, default_extension
 
 # Initialize Pygame
 pygame.init()
@@ -14,6 +22,24 @@ key_sound_mapping = {
     # Add more key-sound pairs as needed
 }
 
+# Mixer settings and float copies of the samples for recording
+mixer_rate, mixer_format, mixer_channels = pygame.mixer.get_init()
+
+# Function to convert a sound to float32 frames in -1..1. The mixer format
+# is the sample size in bits, negative when signed. A float mixer also
+# reports -32, like int32, so float samples are told apart by their dtype.
+def sound_to_float(sound):
+    samples = pygame.sndarray.array(sound).reshape(-1, mixer_channels)
+    if samples.dtype.kind == 'f':
+        return samples.astype(np.float32)
+    half_range = 2 ** (abs(mixer_format) - 1)
+    samples = samples.astype(np.float32)
+    if mixer_format > 0:
+        samples -= half_range  # Unsigned samples are centred on half the range
+    return samples / half_range
+
+key_sample_mapping = {key: sound_to_float(sound) for key, sound in key_sound_mapping.items()}
+
 # Set up the display
 initial_resolution = (800, 800)
 screen = pygame.display.set_mode(initial_resolution)
@@ -37,6 +63,63 @@ circle_expand_duration = 500  # Time to expand the circle (0.5 seconds)
 fullscreen = False
 fullscreen_resolution = (1920, 1080)  # Adjust this to your desired fullscreen resolution
 
+# Recording state: the triggered samples are mixed in software, in step
+# with the mixer, and handed to the recorder's background writer
+recorder = None
+record_start_time = 0
+recorded_frames = 0
+record_voices = []  # [samples, position] for each sound still playing
+record_block_frames = 1024
+mix_buffer = np.zeros((0, mixer_channels), dtype=np.float32)
+
+# Function to show the recording state in the window caption
+def show_recording_caption():
+    pygame.display.set_caption('Sound Player - Recording %s (%d dropped blocks)' % (recorder.path, recorder.dropped_blocks))
+
+# Function to start or stop recording the session to a file
+def toggle_recording():
+    global recorder, record_start_time, recorded_frames
+    if recorder is not None:
+        record_pending_frames(flush=True)  # Record the last partial block too
+        recorder.stop()
+        pygame.display.set_caption('Sound Player - Saved %s (%d dropped blocks)' % (recorder.path, recorder.dropped_blocks))
+        recorder = None
+    else:
+        path = time.strftime("dm_%Y%m%d_%H%M%S") + default_extension()
+        recorder = Recorder(path, mixer_rate, mixer_channels)
+        recorder.start()
+        record_start_time = pygame.time.get_ticks()
+        recorded_frames = 0
+        record_voices.clear()
+        show_recording_caption()
+
+# Function to mix the sounds played since the last call and record them
+def record_pending_frames(flush=False):
+    global recorded_frames, mix_buffer
+    if recorder is None:
+        return
+
+    due_frames = (pygame.time.get_ticks() - record_start_time) * mixer_rate // 1000 - recorded_frames
+    if due_frames <= 0 or (due_frames < record_block_frames and not flush):
+        return  # Wait for a full block so each push is worth a queue slot
+
+    if len(mix_buffer) < due_frames:
+        mix_buffer = np.zeros((due_frames, mixer_channels), dtype=np.float32)
+    mix = mix_buffer[:due_frames]
+    mix[:] = 0
+    for voice in record_voices:
+        samples, position = voice
+        count = min(len(samples) - position, due_frames)
+        mix[:count] += samples[position:position + count]
+        voice[1] = position + count
+    record_voices[:] = [voice for voice in record_voices if voice[1] < len(voice[0])]
+
+    dropped_blocks = recorder.dropped_blocks
+    recorder.push(mix)
+    recorded_frames += due_frames
+    if recorder.dropped_blocks != dropped_blocks:
+        show_recording_caption()
+
 # Function to toggle fullscreen mode
 def toggle_fullscreen():
     global fullscreen, screen
@@ -93,6 +176,8 @@ while running:
         if event.type == pygame.KEYDOWN:
             if event.key == pygame.K_ESCAPE:
                 toggle_fullscreen()
+            elif event.key == pygame.K_r:
+                toggle_recording()
             elif event.key in key_sound_mapping:
                 sound = key_sound_mapping[event.key]
                 channel = sound_channels.pop(0)  # Get an available channel
@@ -100,6 +185,10 @@ while running:
                 key_press_times[event.key] = pygame.time.get_ticks()
                 sound_channels.append(channel)  # Return the used channel to the end
 
+                if recorder is not None:
+                    record_pending_frames(flush=True)  # Mix up to this hit so it lands on time
+                    record_voices.append([key_sample_mapping[event.key], 0])
+
                 # Generate random location for flashing circle within the screen dimensions
                 flash_circle_location = (random.randint(0, screen.get_width()), random.randint(0, screen.get_height()))
 
@@ -119,5 +208,13 @@ while running:
     # Update the display
     pygame.display.flip()
 
+    # Record what has been played so far
+    record_pending_frames()
+
+# Record what is still pending and stop recording before quitting
+if recorder is not None:
+    record_pending_frames(flush=True)
+    recorder.stop()
+
 # Quit Pygame
 pygame.quit()
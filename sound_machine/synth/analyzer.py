@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+import threading
+import time
+import numpy as np
+import scipy.fft
+import scipy.signal as signal
+
+# Default analysis settings
+fft_size = 2048
+hop_size = 512
+history_frames = 200
+max_analysis_rate = 30  # Analysis passes per second
+floor_db = -100.0
+
+
+# Computes overlapping windowed FFTs incrementally on the output stream.
+# write() only copies samples into a ring buffer, so it is cheap enough for
+# the audio path. A background thread wakes at most max_analysis_rate times
+# per second, analyzes every complete hop that arrived since the last pass
+# and scrolls the spectrogram in place. The window, frame and spectrum
+# buffers are allocated once; the FFT size never changes, so scipy.fft
+# reuses its cached plan for every frame.
+class SpectrumAnalyzer:
+    def __init__(self, sample_rate, size=fft_size, hop=hop_size, history=history_frames, rate=max_analysis_rate):
+        self.sample_rate = sample_rate
+        self.size = size
+        self.hop = hop
+        self.interval = 1.0 / rate
+        self.window = signal.get_window('hann', size).astype(np.float32)
+        self.scale = 2.0 / np.sum(self.window)  # Full-scale sine reads 0 dB
+        self.frame = np.zeros(size, dtype=np.float32)
+        self.magnitude = np.zeros(size // 2 + 1, dtype=np.float32)
+        self.frequencies = np.fft.rfftfreq(size, 1.0 / sample_rate)
+
+        # Ring buffer of recent output, a power of two larger than one frame
+        ring_size = 1 << int(np.ceil(np.log2(size + sample_rate)))
+        self.ring = np.zeros(ring_size, dtype=np.float32)
+        self.write_index = 0
+        self.analyzed_index = 0
+
+        # Latest spectrum and scrolling spectrogram (frequency bins x time)
+        self.spectrum = np.full(size // 2 + 1, floor_db, dtype=np.float32)
+        self.spectrogram = np.full((size // 2 + 1, history), floor_db, dtype=np.float32)
+        self.frames_analyzed = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.analysis_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    # Function called from the audio path: copy the block into the ring
+    def write(self, samples):
+        samples = samples[-len(self.ring):]
+        start = self.write_index % len(self.ring)
+        first = min(len(samples), len(self.ring) - start)
+        self.ring[start:start + first] = samples[:first]
+        self.ring[:len(samples) - first] = samples[first:]
+        self.write_index += len(samples)
+
+    # Function to analyze every complete hop that has arrived since the last call
+    def process(self):
+        # If we fell more than a ring behind, skip to the newest audio
+        oldest = self.write_index - len(self.ring) + self.size
+        if self.analyzed_index < oldest:
+            self.analyzed_index = oldest - (oldest % self.hop)
+
+        analyzed = 0
+        while self.analyzed_index + self.hop <= self.write_index:
+            self.analyzed_index += self.hop
+            end = self.analyzed_index % len(self.ring)
+            if self.analyzed_index < self.size:
+                continue  # Not enough audio yet for a full frame
+            if end >= self.size:
+                self.frame[:] = self.ring[end - self.size:end]
+            else:
+                self.frame[:self.size - end] = self.ring[end - self.size:]
+                self.frame[self.size - end:] = self.ring[:end]
+
+            self.frame *= self.window
+            np.abs(scipy.fft.rfft(self.frame), out=self.magnitude)
+            self.magnitude *= self.scale
+            np.maximum(self.magnitude, 10 ** (floor_db / 20), out=self.magnitude)
+            np.log10(self.magnitude, out=self.spectrum)
+            self.spectrum *= 20
+
+            # Scroll the spectrogram one column to the left in place
+            self.spectrogram[:, :-1] = self.spectrogram[:, 1:]
+            self.spectrogram[:, -1] = self.spectrum
+            analyzed += 1
+        self.frames_analyzed += analyzed
+        return analyzed
+
+    def analysis_loop(self):
+        while self.running:
+            started = time.perf_counter()
+            self.process()
+            time.sleep(max(self.interval - (time.perf_counter() - started), 0))
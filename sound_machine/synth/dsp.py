@@ -0,0 +1,649 @@
+#!/usr/bin/env python
+
+import time
+import numpy as np
+import scipy.signal as signal
+from scipy.io import wavfile
+
+# Oversampling factors available for the oscillator + filter stage
+oversampling_factors = (1, 2, 4, 8)
+
+# Taps per polyphase branch of the decimation filter
+decimator_taps_per_phase = 16
+
+# Output formats: name -> (bytes per sample, full scale integer value or None for float)
+output_formats = {
+    'int16': (2, 32767),
+    'int24': (3, 8388607),
+    'float32': (4, None),
+}
+
+
+# Function to evaluate a waveform from a phase array given in cycles (0..1).
+# The phase array is used as scratch space and the result is written to out.
+def wave_shape(waveform_type, phase, pulse_width, out):
+    if waveform_type == "Sine":
+        np.multiply(phase, 2 * np.pi, out=phase)
+        np.sin(phase, out=out)
+    elif waveform_type == "Triangle":
+        np.multiply(phase, 2, out=phase)
+        phase -= 1
+        np.abs(phase, out=phase)
+        phase *= 2
+        np.subtract(phase, 1, out=out)
+    elif waveform_type == "Sawtooth":
+        np.add(phase, 0.5, out=out)
+        np.floor(out, out=out)
+        np.subtract(phase, out, out=out)
+        out *= 2
+    elif waveform_type == "Square":
+        np.multiply(phase, 2, out=phase)
+        phase += pulse_width
+        np.floor(phase, out=phase)
+        np.mod(phase, 2, out=out)
+    else:
+        raise ValueError("Unknown waveform type: %s" % waveform_type)
+    return out
+
+
+# Decimates an oversampled signal by an integer factor with a precomputed
+# FIR low-pass. Only every factor-th output is computed (polyphase form) and
+# the filter history is kept so consecutive blocks join seamlessly.
+class PolyphaseDecimator:
+    def __init__(self, factor, taps_per_phase=decimator_taps_per_phase):
+        self.factor = factor
+        if factor == 1:
+            self.taps = np.ones(1, dtype=np.float32)
+        else:
+            # Cut off just below the Nyquist frequency of the output rate
+            taps = signal.firwin(factor * taps_per_phase, 0.9 / factor, window=('kaiser', 8.0))
+            self.taps = taps[::-1].astype(np.float32)  # Reversed so each output is a dot product
+        self.history_length = len(self.taps) - 1
+        self.extended = np.zeros(self.history_length, dtype=np.float32)
+        self.output = np.zeros(0, dtype=np.float32)
+        self.product = np.zeros(0, dtype=np.float32)
+
+    def reset(self):
+        self.extended[:] = 0
+
+    def process(self, samples):
+        if self.factor == 1:
+            return samples
+        if len(samples) % self.factor:
+            raise ValueError("Block length must be a multiple of the decimation factor")
+
+        # Grow the work buffers only when a larger block arrives
+        num_outputs = len(samples) // self.factor
+        if len(self.extended) < self.history_length + len(samples):
+            extended = np.zeros(self.history_length + len(samples), dtype=np.float32)
+            extended[:self.history_length] = self.extended[:self.history_length]
+            self.extended = extended
+        if len(self.output) < num_outputs:
+            self.output = np.zeros(num_outputs, dtype=np.float32)
+            self.product = np.zeros(num_outputs, dtype=np.float32)
+
+        extended = self.extended[:self.history_length + len(samples)]
+        extended[self.history_length:] = samples
+        output = self.output[:num_outputs]
+        product = self.product[:num_outputs]
+
+        # Accumulate one tap at a time over every output of the block. Each
+        # output sums its products in the same order whatever the block
+        # size, which keeps the result bit-exact between block sizes.
+        output[:] = 0
+        last = self.factor - 1 + (num_outputs - 1) * self.factor
+        for k, tap in enumerate(self.taps):
+            np.multiply(extended[k + self.factor - 1:k + last + 1:self.factor], tap, out=product)
+            output += product
+        extended[:self.history_length] = extended[len(samples):]
+        return output
+
+
+# Attack/decay/sustain/release envelope rendered block by block. Each stage
+# is a linear ramp indexed by its own sample counter, so the result does not
+# depend on how the note is split into blocks.
+class ADSREnvelope:
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.set_parameters(0.01, 0.05, 0.7, 0.1)
+        self.stage = 'idle'
+        self.level = 0.0
+        self.output = np.zeros(0, dtype=np.float32)
+        self.counts = np.zeros(0)
+        self.ramp = np.zeros(0)
+
+    def set_parameters(self, attack_time, decay_time, sustain_level, release_time):
+        self.attack_time = attack_time
+        self.decay_time = decay_time
+        self.sustain_level = sustain_level
+        self.release_time = release_time
+
+    def note_on(self):
+        self.start_stage('attack')
+
+    def note_off(self):
+        if self.stage != 'idle':
+            self.start_stage('release')
+
+    def is_active(self):
+        return self.stage != 'idle'
+
+    # Function to silence the envelope at once, without a release
+    def reset(self):
+        self.level = 0.0
+        self.start_stage('idle')
+
+    # Function to enter a stage, remembering where its ramp starts and ends
+    def start_stage(self, stage):
+        self.stage = stage
+        self.stage_position = 0
+        self.stage_start = self.level
+        if stage == 'attack':
+            self.stage_target, duration = 1.0, self.attack_time
+        elif stage == 'decay':
+            self.stage_target, duration = self.sustain_level, self.decay_time
+        elif stage == 'release':
+            self.stage_target, duration = 0.0, self.release_time
+        else:
+            self.stage_target, duration = self.level, 0.0
+        self.stage_length = int(round(duration * self.sample_rate))
+
+    def render(self, num_samples):
+        if len(self.output) < num_samples:
+            self.output = np.zeros(num_samples, dtype=np.float32)
+            self.counts = np.arange(1, num_samples + 1, dtype=np.float64)
+            self.ramp = np.zeros(num_samples, dtype=np.float64)
+        output = self.output[:num_samples]
+
+        position = 0
+        while position < num_samples:
+            if self.stage in ('idle', 'sustain'):
+                output[position:] = self.level
+                break
+
+            count = min(self.stage_length - self.stage_position, num_samples - position)
+            ramp = self.ramp[:count]
+            np.add(self.counts[:count], self.stage_position, out=ramp)
+            ramp *= self.stage_target - self.stage_start
+            ramp /= max(self.stage_length, 1)
+            ramp += self.stage_start
+            output[position:position + count] = ramp
+            position += count
+            self.stage_position += count
+
+            if self.stage_position >= self.stage_length:
+                # Stage finished, move on to the next one
+                self.level = self.stage_target
+                self.start_stage({'attack': 'decay', 'decay': 'sustain', 'release': 'idle'}[self.stage])
+            else:
+                self.level = float(output[position - 1])
+        return output
+
+
+# First order low-pass filter that keeps its state between blocks
+class LowPassFilter:
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.state = np.zeros(1, dtype=np.float32)
+        self.cache = {}
+
+    def reset(self):
+        self.state[:] = 0
+
+    # Function to get (and cache) the filter coefficients for a cutoff
+    def coefficients(self, cutoff_frequency):
+        if cutoff_frequency not in self.cache:
+            nyquist_frequency = 0.5 * self.sample_rate
+            normalized = min(cutoff_frequency / nyquist_frequency, 0.99)
+            b, a = signal.butter(1, normalized, btype='low', analog=False)
+            self.cache[cutoff_frequency] = (b.astype(np.float32), a.astype(np.float32))
+        return self.cache[cutoff_frequency]
+
+    # lfilter has no output argument, so each call returns a new array
+    def process(self, samples, cutoff_frequency):
+        if len(samples) == 0:
+            return samples  # lfilter would hand back a cleared state
+        b, a = self.coefficients(cutoff_frequency)
+        samples, self.state = signal.lfilter(b, a, samples, zi=self.state)
+        return samples
+
+
+# A single oscillator followed by the low-pass filter, optionally rendered
+# at an oversampled rate and decimated back to the output sample rate.
+# All stages run in float32 on buffers that are reused between blocks.
+class SynthVoice:
+    def __init__(self, sample_rate, oversampling=1):
+        self.sample_rate = sample_rate
+        self.ramp = np.zeros(0)
+        self.phase_buffer = np.zeros(0)
+        self.sample_buffer = np.zeros(0, dtype=np.float32)
+        self.set_oversampling(oversampling)
+
+    def set_oversampling(self, oversampling):
+        if oversampling not in oversampling_factors:
+            raise ValueError("Oversampling must be one of %s" % (oversampling_factors,))
+        self.oversampling = oversampling
+        self.decimator = PolyphaseDecimator(oversampling)
+        self.filter = LowPassFilter(self.sample_rate * oversampling)
+        self.reset()
+
+    def reset(self):
+        self.phase_origin = 0.0
+        self.increment = 0.0
+        self.run_samples = 0
+        self.filter.reset()
+        self.decimator.reset()
+
+    # Function to get the current phase in cycles
+    def phase(self):
+        return (self.phase_origin + self.increment * self.run_samples) % 1.0
+
+    def render(self, num_samples, frequency, amplitude, waveform_type, pulse_width=0.5, cutoff_frequency=None):
+        internal_rate = self.sample_rate * self.oversampling
+        internal_samples = num_samples * self.oversampling
+
+        # Grow the work buffers only when a larger block arrives
+        if len(self.ramp) < internal_samples:
+            self.ramp = np.arange(internal_samples, dtype=np.float64)
+            self.phase_buffer = np.zeros(internal_samples, dtype=np.float64)
+            self.sample_buffer = np.zeros(internal_samples, dtype=np.float32)
+
+        # The phase runs on from where the frequency last changed, counted in
+        # samples, so blocks join without clicks and the result does not
+        # depend on the block size. It is kept in float64 so long notes do
+        # not drift.
+        increment = frequency / internal_rate
+        if increment != self.increment:
+            self.phase_origin = self.phase()
+            self.increment = increment
+            self.run_samples = 0
+        phase = self.phase_buffer[:internal_samples]
+        np.add(self.ramp[:internal_samples], self.run_samples, out=phase)
+        phase *= increment
+        phase += self.phase_origin
+        np.mod(phase, 1.0, out=phase)
+        self.run_samples += internal_samples
+
+        samples = wave_shape(waveform_type, phase, pulse_width, self.sample_buffer[:internal_samples])
+        samples *= amplitude
+
+        if cutoff_frequency is not None:
+            samples = self.filter.process(samples, cutoff_frequency)
+
+        return self.decimator.process(samples)
+
+
+# Function to load a WAV file as mono float32 samples in -1..1
+def load_sample(path):
+    rate, data = wavfile.read(path)
+    if data.dtype == np.uint8:
+        data = (data.astype(np.float32) - 128) / 128
+    elif data.dtype.kind == 'i':
+        data = data.astype(np.float32) / -np.iinfo(data.dtype).min
+    else:
+        data = data.astype(np.float32)
+    if data.ndim == 2:
+        data = data.mean(axis=1)
+    return rate, np.ascontiguousarray(data, dtype=np.float32)
+
+
+# Work buffers for interpolate_sample, grown to the largest block seen
+class InterpolationBuffers:
+    def __init__(self, size=0):
+        self.resize(size)
+
+    def resize(self, size):
+        self.index = np.zeros(size, dtype=np.int64)
+        self.fraction = np.zeros(size, dtype=np.float64)
+        self.weight = np.zeros(size, dtype=np.float64)
+        self.gathered = np.zeros(size, dtype=np.float32)
+
+
+# Function to read a sample at fractional positions with linear interpolation.
+# Positions past the last sample read as silence. positions is overwritten.
+def interpolate_sample(data, positions, out, buffers):
+    count = len(positions)
+    if len(buffers.index) < count:
+        buffers.resize(count)
+    index = buffers.index[:count]
+    fraction = buffers.fraction[:count]
+    weight = buffers.weight[:count]
+    gathered = buffers.gathered[:count]
+
+    np.clip(positions, 0, len(data) - 1, out=positions)
+    np.copyto(index, positions, casting='unsafe')
+    np.minimum(index, len(data) - 2, out=index)
+    np.subtract(positions, index, out=fraction)
+    np.subtract(1, fraction, out=weight)
+    np.take(data, index, out=gathered)
+    np.multiply(gathered, weight, out=out, casting='same_kind')
+    index += 1
+    np.take(data, index, out=gathered)
+    np.multiply(gathered, fraction, out=fraction)
+    np.add(out, fraction, out=out, casting='same_kind')
+    return out
+
+
+# A recorded sample that can be played at any pitch. The sample sounds at
+# its original pitch when played at root_frequency. Loop points are given in
+# source samples; without them the sample plays once. Resampled copies for
+# frequently used pitches can be precomputed so voices only copy from them.
+class SampleInstrument:
+    def __init__(self, data, source_rate, root_frequency=261.63, loop_start=None, loop_end=None):
+        self.data = np.concatenate((data, np.zeros(1, dtype=np.float32)))  # Guard sample for interpolation
+        self.length = len(data)
+        self.source_rate = source_rate
+        self.root_frequency = root_frequency
+        self.cache = {}
+        self.set_loop(loop_start, loop_end)
+
+    def set_loop(self, loop_start, loop_end):
+        if loop_start is not None and not 0 <= loop_start < loop_end <= self.length:
+            raise ValueError("Loop points must satisfy 0 <= loop_start < loop_end <= sample length")
+        self.loop_start = loop_start
+        self.loop_end = loop_end
+
+        # Samples read during playback. A looped sample ends at the loop end
+        # with the loop start as guard sample, so the last segment blends
+        # into the start of the loop instead of fading to silence.
+        if loop_start is None:
+            self.playback_data = self.data
+        else:
+            self.playback_data = np.concatenate((self.data[:loop_end], self.data[loop_start:loop_start + 1]))
+        self.cache.clear()
+
+    def is_looped(self):
+        return self.loop_start is not None
+
+    # Function to get the source samples advanced per output sample
+    def step(self, frequency, sample_rate):
+        return frequency / self.root_frequency * self.source_rate / sample_rate
+
+    # Function to resample the one-shot part of the sample for the given pitches
+    def precompute(self, frequencies, sample_rate):
+        one_shot_end = self.loop_end if self.is_looped() else self.length
+        for frequency in frequencies:
+            step = self.step(frequency, sample_rate)
+            if step in self.cache:
+                continue
+            positions = np.arange(int(np.ceil(one_shot_end / step)), dtype=np.float64) * step
+            self.cache[step] = interpolate_sample(self.playback_data, positions, np.zeros(len(positions), dtype=np.float32),
+                                                  InterpolationBuffers(len(positions)))
+
+    def cached(self, step):
+        return self.cache.get(step)
+
+
+# One note of a sample instrument, with its own ADSR envelope and filter
+class SamplerVoice:
+    def __init__(self, instrument, sample_rate):
+        self.instrument = instrument
+        self.sample_rate = sample_rate
+        self.envelope = ADSREnvelope(sample_rate)
+        self.filter = LowPassFilter(sample_rate)
+        self.frequency = 0.0
+        self.sample_index = 0  # Output samples rendered since note on
+        self.ramp = np.zeros(0)
+        self.positions = np.zeros(0)
+        self.output = np.zeros(0, dtype=np.float32)
+        self.interpolation = InterpolationBuffers()
+
+    def note_on(self, frequency):
+        self.frequency = frequency
+        self.sample_index = 0
+        self.filter.reset()
+        self.envelope.note_on()
+
+    def note_off(self):
+        self.envelope.note_off()
+
+    def is_active(self):
+        return self.envelope.is_active()
+
+    def render(self, num_samples, amplitude, cutoff_frequency=None):
+        if len(self.ramp) < num_samples:
+            self.ramp = np.arange(num_samples, dtype=np.float64)
+            self.positions = np.zeros(num_samples, dtype=np.float64)
+            self.output = np.zeros(num_samples, dtype=np.float32)
+        output = self.output[:num_samples]
+        instrument = self.instrument
+
+        # Positions are computed from the sample counter rather than
+        # accumulated, so the output does not depend on the block size
+        step = instrument.step(self.frequency, self.sample_rate)
+        variant = instrument.cached(step)
+        start = self.sample_index
+        self.sample_index += num_samples
+
+        # The precomputed pitch covers the sample up to the loop end (or its end)
+        one_shot_end = instrument.loop_end if instrument.is_looped() else instrument.length
+        if variant is not None and self.sample_index * step <= one_shot_end:
+            # Still inside the one-shot part: copy from the precomputed pitch
+            output[:] = variant[start:self.sample_index]
+        else:
+            positions = self.positions[:num_samples]
+            np.add(self.ramp[:num_samples], start, out=positions)
+            positions *= step
+            # Positions only increase, so everything from the first one past
+            # the end onwards needs wrapping (or silencing)
+            if instrument.is_looped():
+                # Wrap everything past the loop end back into the loop
+                past_end = positions[np.searchsorted(positions, instrument.loop_end):]
+                past_end -= instrument.loop_start
+                np.mod(past_end, instrument.loop_end - instrument.loop_start, out=past_end)
+                past_end += instrument.loop_start
+                interpolate_sample(instrument.playback_data, positions, output, self.interpolation)
+            else:
+                finished = np.searchsorted(positions, instrument.length)
+                interpolate_sample(instrument.playback_data, positions, output, self.interpolation)
+                output[finished:] = 0
+
+        # Filter first and shape with the envelope last, so a finished
+        # release is exact silence whatever the block size
+        output *= amplitude
+        if cutoff_frequency is not None:
+            output = self.filter.process(output, cutoff_frequency)
+        output *= self.envelope.render(num_samples)
+
+        # A one-shot sample that has run out is cut at its end and frees the voice
+        if not instrument.is_looped():
+            end_index = int(np.ceil(instrument.length / step))
+            if self.sample_index >= end_index:
+                output[max(end_index - start, 0):] = 0
+                self.envelope.reset()
+        return output
+
+
+# Polyphonic player for a sample instrument. Voices are reused once their
+# release has finished; when all are busy the oldest note is stolen.
+class Sampler:
+    def __init__(self, instrument, sample_rate, num_voices=8):
+        self.instrument = instrument
+        self.sample_rate = sample_rate
+        self.voices = [SamplerVoice(instrument, sample_rate) for _ in range(num_voices)]
+        self.started = []  # Voices in the order their notes started
+        self.mix = np.zeros(0, dtype=np.float32)
+
+    def set_instrument(self, instrument):
+        self.instrument = instrument
+        for voice in self.voices:
+            voice.instrument = instrument
+            voice.envelope.reset()
+        self.started = []
+
+    def set_envelope(self, attack_time, decay_time, sustain_level, release_time):
+        for voice in self.voices:
+            voice.envelope.set_parameters(attack_time, decay_time, sustain_level, release_time)
+
+    def note_on(self, frequency):
+        free = [voice for voice in self.voices if not voice.is_active()]
+        voice = free[0] if free else self.started[0]
+        if voice in self.started:
+            self.started.remove(voice)
+        voice.note_on(frequency)
+        self.started.append(voice)
+        return voice
+
+    def note_off(self, frequency=None):
+        for voice in self.started:
+            if frequency is None or voice.frequency == frequency:
+                voice.note_off()
+
+    def render(self, num_samples, amplitude, cutoff_frequency=None):
+        if len(self.mix) < num_samples:
+            self.mix = np.zeros(num_samples, dtype=np.float32)
+        mix = self.mix[:num_samples]
+        mix[:] = 0
+        for voice in list(self.started):
+            mix += voice.render(num_samples, amplitude, cutoff_frequency)
+            if not voice.is_active():
+                self.started.remove(voice)
+        return mix
+
+
+# The synth2 signal chain: the oscillator voice shaped by its envelope, or
+# the polyphonic sampler for the "Sampler" voice type. After note_off() the
+# notes release, so keep rendering blocks until is_active() is false.
+class Synth:
+    def __init__(self, sample_rate, sampler, oversampling=1):
+        self.voice = SynthVoice(sample_rate, oversampling)
+        self.envelope = ADSREnvelope(sample_rate)
+        self.sampler = sampler
+        self.sampling = False  # True while the sampler is the voice being rendered
+
+    def set_envelope(self, attack_time, decay_time, sustain_level, release_time):
+        self.envelope.set_parameters(attack_time, decay_time, sustain_level, release_time)
+        self.sampler.set_envelope(attack_time, decay_time, sustain_level, release_time)
+
+    # Function to start a note, the oscillator always attacks from silence
+    def note_on(self, frequency, waveform_type):
+        self.voice.reset()
+        self.envelope.reset()
+        self.envelope.note_on()
+        self.sampling = waveform_type == "Sampler"
+        if self.sampling and frequency:
+            self.sampler.note_on(frequency)
+
+    def note_off(self):
+        self.envelope.note_off()
+        self.sampler.note_off()
+
+    def is_active(self):
+        return bool(self.sampler.started) if self.sampling else self.envelope.is_active()
+
+    def render(self, num_samples, frequency, amplitude, waveform_type, pulse_width=0.5, cutoff_frequency=None):
+        # The sampler applies the envelope and filter to each of its voices
+        self.sampling = waveform_type == "Sampler"
+        if self.sampling:
+            return self.sampler.render(num_samples, amplitude, cutoff_frequency)
+        samples = self.voice.render(num_samples, frequency, amplitude, waveform_type, pulse_width, cutoff_frequency)
+        samples *= self.envelope.render(num_samples)
+        return samples
+
+
+# The single conversion from the float32 engine to the playback format.
+# Optionally adds TPDF dither before quantizing and counts clipped samples.
+# The returned array is reused by the next call, copy it to keep it.
+class OutputStage:
+    def __init__(self, output_format='int16', dither=True, seed=None):
+        self.set_format(output_format)
+        self.dither = dither
+        self.random = np.random.default_rng(seed)
+        self.scaled = np.zeros(0, dtype=np.float32)
+        self.noise = np.zeros(0, dtype=np.float32)
+        self.integers = np.zeros(0, dtype='<i4')
+        self.int16_output = np.zeros(0, dtype=np.int16)
+        self.int24_output = np.zeros((0, 3), dtype=np.uint8)
+        self.reset_statistics()
+
+    def set_format(self, output_format):
+        if output_format not in output_formats:
+            raise ValueError("Output format must be one of %s" % (tuple(output_formats),))
+        self.output_format = output_format
+        self.bytes_per_sample, self.full_scale = output_formats[output_format]
+
+    def reset_statistics(self):
+        self.total_samples = 0
+        self.clipped_samples = 0
+        self.peak = 0.0
+
+    def statistics(self):
+        return {
+            'total_samples': self.total_samples,
+            'clipped_samples': self.clipped_samples,
+            'peak': self.peak,
+        }
+
+    def process(self, samples):
+        num_samples = len(samples)
+        if len(self.scaled) < num_samples:
+            self.scaled = np.zeros(num_samples, dtype=np.float32)
+            self.noise = np.zeros(num_samples, dtype=np.float32)
+            self.integers = np.zeros(num_samples, dtype='<i4')
+            self.int16_output = np.zeros(num_samples, dtype=np.int16)
+            self.int24_output = np.zeros((num_samples, 3), dtype=np.uint8)
+        scaled = self.scaled[:num_samples]
+
+        # Clip statistics are gathered on the engine signal before quantizing
+        self.total_samples += num_samples
+        if num_samples:
+            self.peak = max(self.peak, float(np.max(np.abs(samples))))
+            self.clipped_samples += int(np.count_nonzero((samples > 1.0) | (samples < -1.0)))
+
+        if self.full_scale is None:
+            np.clip(samples, -1.0, 1.0, out=scaled)
+            return scaled
+
+        np.multiply(samples, self.full_scale, out=scaled)
+        if self.dither:
+            # Triangular noise of +/- 1 LSB from the difference of two uniforms
+            noise = self.noise[:num_samples]
+            self.random.random(dtype=np.float32, out=noise)
+            scaled += noise
+            self.random.random(dtype=np.float32, out=noise)
+            scaled -= noise
+        np.rint(scaled, out=scaled)
+        np.clip(scaled, -self.full_scale - 1, self.full_scale, out=scaled)
+
+        if self.output_format == 'int16':
+            output = self.int16_output[:num_samples]
+            np.copyto(output, scaled, casting='unsafe')
+            return output
+
+        # Pack 24-bit samples as three little-endian bytes
+        integers = self.integers[:num_samples]
+        np.copyto(integers, scaled, casting='unsafe')
+        output = self.int24_output[:num_samples]
+        output[:] = integers.view(np.uint8).reshape(-1, 4)[:, :3]
+        return output
+
+    # Function to play a processed block with simpleaudio
+    def play(self, simpleaudio_module, samples, sample_rate):
+        return simpleaudio_module.play_buffer(self.process(samples), 1, self.bytes_per_sample, sample_rate)
+
+
+# Function to measure the CPU cost of each oversampling factor. Returns the
+# fraction of real time spent rendering (0.05 means 5% of one core).
+def measure_oversampling_cost(sample_rate=48000, waveform_type="Sawtooth", frequency=2000,
+                              block_size=4800, blocks=20, cutoff_frequency=10000):
+    costs = {}
+    for factor in oversampling_factors:
+        voice = SynthVoice(sample_rate, factor)
+        start = time.perf_counter()
+        for _ in range(blocks):
+            voice.render(block_size, frequency, 0.5, waveform_type, 0.5, cutoff_frequency)
+        elapsed = time.perf_counter() - start
+        costs[factor] = elapsed / (blocks * block_size / sample_rate)
+    return costs
+
+
+# Function to format the oversampling cost report
+def oversampling_cost_report(costs):
+    lines = ["Oversampling CPU cost (fraction of real time):"]
+    for factor, cost in costs.items():
+        lines.append("  %dx: %.2f%%" % (factor, cost * 100))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(oversampling_cost_report(measure_oversampling_cost()))
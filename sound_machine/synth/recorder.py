@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+import threading
+import time
+import wave
+import numpy as np
+from dsp import OutputStage
+
+# FLAC output is only available when soundfile is installed
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+# Default sizes of the block queue and of each disk write
+queue_blocks = 64
+max_block_frames = 8192
+write_frames = 65536
+
+
+# Function to pick the file extension used for new recordings
+def default_extension():
+    return '.flac' if soundfile is not None else '.wav'
+
+
+# Function to get the sample format a file can actually store. FLAC has no
+# float samples and the wave module only writes integer PCM, so float32 is
+# kept only for WAV files written through soundfile and saved as int24
+# otherwise.
+def recorded_format(path, sample_format):
+    if sample_format == 'float32' and (soundfile is None or path.lower().endswith('.flac')):
+        return 'int24'
+    return sample_format
+
+
+# Records audio blocks to disk without blocking the audio path.
+# push() copies each block into a fixed ring of preallocated slots (single
+# producer, single consumer, so the two indices need no lock) and a
+# background thread drains the ring into large sequential writes, converting
+# them with the same OutputStage format and dither as playback. When the
+# writer falls behind, blocks are dropped and counted instead of growing
+# memory, so long sessions run in constant memory.
+class Recorder:
+    def __init__(self, path, sample_rate, channels=1, sample_format='int16', dither=True,
+                 num_blocks=queue_blocks, block_frames=max_block_frames):
+        if path.lower().endswith('.flac') and soundfile is None:
+            raise RuntimeError("FLAC recording needs the soundfile package")
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_format = recorded_format(path, sample_format)
+        self.output_stage = OutputStage(self.sample_format, dither)
+        self.slots = np.zeros((num_blocks, block_frames, channels), dtype=np.float32)
+        self.slot_frames = np.zeros(num_blocks, dtype=np.int64)
+        self.write_buffer = np.zeros((write_frames, channels), dtype=np.float32)
+        self.widened = np.zeros((write_frames * channels, 4), dtype=np.uint8)
+        self.write_index = 0
+        self.read_index = 0
+        self.dropped_blocks = 0
+        self.recorded_frames = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        subtype = {'int16': 'PCM_16', 'int24': 'PCM_24', 'float32': 'FLOAT'}[self.sample_format]
+        if self.path.lower().endswith('.flac'):
+            self.file = soundfile.SoundFile(self.path, 'w', self.sample_rate, self.channels, format='FLAC', subtype=subtype)
+        elif self.sample_format == 'float32':
+            self.file = soundfile.SoundFile(self.path, 'w', self.sample_rate, self.channels, format='WAV', subtype=subtype)
+        else:
+            self.file = wave.open(self.path, 'wb')
+            self.file.setnchannels(self.channels)
+            self.file.setsampwidth(self.output_stage.bytes_per_sample)
+            self.file.setframerate(self.sample_rate)
+        self.running = True
+        self.thread = threading.Thread(target=self.writer_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.file.close()
+
+    # Function called from the audio path: copy the block and return at once
+    def push(self, samples):
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.ndim == 1:
+            samples = samples.reshape(-1, 1)
+        block_frames = self.slots.shape[1]
+        for start in range(0, len(samples), block_frames):
+            chunk = samples[start:start + block_frames]
+            if self.write_index - self.read_index >= len(self.slots):
+                self.dropped_blocks += 1
+                continue
+            slot = self.write_index % len(self.slots)
+            self.slots[slot, :len(chunk)] = chunk
+            self.slot_frames[slot] = len(chunk)
+            self.write_index += 1  # Publish the slot only after it is filled
+
+    # Function to gather the queued blocks and write them in large chunks
+    def drain(self):
+        buffered = 0
+        while self.read_index < self.write_index:
+            slot = self.read_index % len(self.slots)
+            frames = int(self.slot_frames[slot])
+            if buffered + frames > len(self.write_buffer):
+                self.write_frames(buffered)
+                buffered = 0
+            self.write_buffer[buffered:buffered + frames] = self.slots[slot, :frames]
+            buffered += frames
+            self.read_index += 1  # Hand the slot back to the producer
+        if buffered:
+            self.write_frames(buffered)
+
+    # Function to convert buffered frames to the file format and write them
+    def write_frames(self, frames):
+        # Channels are interleaved, so the frames convert as one flat block
+        converted = self.output_stage.process(self.write_buffer[:frames].reshape(-1))
+        if isinstance(self.file, wave.Wave_write):
+            self.file.writeframes(converted.tobytes())
+        elif self.sample_format == 'int24':
+            # libsndfile takes 24-bit audio as the top three bytes of int32 samples
+            widened = self.widened[:len(converted)]
+            widened[:, 1:] = converted
+            self.file.write(widened.view('<i4').reshape(-1, self.channels))
+        else:
+            self.file.write(converted.reshape(-1, self.channels))
+        self.recorded_frames += frames
+
+    def writer_loop(self):
+        while self.running:
+            # Let a few blocks accumulate so each write is large and sequential
+            time.sleep(0.05)
+            self.drain()
+        self.drain()
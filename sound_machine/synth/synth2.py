@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 
+import os
+import time
 import tkinter as tk
+from tkinter import filedialog
 import numpy as np
 import simpleaudio as sa
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import scipy.signal as signal
+from matplotlib.figure import Figure
+from dsp import Synth, OutputStage, Sampler, SampleInstrument, load_sample, output_formats, oversampling_factors, measure_oversampling_cost, oversampling_cost_report
+from recorder import Recorder, default_extension
+from analyzer import SpectrumAnalyzer, max_analysis_rate, floor_db
 
 # Variables to keep track of the oscillator state and play_obj
 oscillator_on = False
@@ -47,110 +53,136 @@ def get_note_frequency():
     else:
         return 0  # Return 0 if no note is selected
 
+# Block size and time array, allocated once and reused for every block
+block_size = int(sample_rate * duration_ms / 1000)
+t = np.linspace(0, duration_ms / 1000, block_size, endpoint=False)
+
+# Drum machine samples that can be played across the keyboard
+samples_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'drum')
+sample_names = ['sound_a.wav', 'sound_s.wav', 'sound_d.wav']
+instruments = {}  # (sample name, looped) -> SampleInstrument
+
+# Function to get the frequencies of every note in the playable octaves
+def common_note_frequencies():
+    return [frequency * (2 ** (note_octave - 4)) for note_octave in range(1, 8) for frequency in notes.values()]
+
+# Function to load a sample instrument, with the keyboard notes precomputed
+def get_instrument(name, looped):
+    if (name, looped) not in instruments:
+        rate, data = load_sample(os.path.join(samples_directory, name))
+        instrument = SampleInstrument(data, rate)
+        if looped:
+            instrument.set_loop(0, len(data))
+        instrument.precompute(common_note_frequencies(), sample_rate)
+        instruments[(name, looped)] = instrument
+    return instruments[(name, looped)]
+
+# Polyphonic sampler voice type
+sampler = Sampler(get_instrument(sample_names[0], False), sample_rate)
+
+# Oscillator + filter voice shaped by its envelope, or the sampler. Keeps
+# phase and filter state between blocks and plays each note's release.
+synth = Synth(sample_rate, sampler)
+
+# The single conversion from the float32 engine to the playback format
+output_stage = OutputStage('int16', dither=True)
+
+# Spectrum analyzer fed with every output block, analyzed on its own thread
+analyzer = SpectrumAnalyzer(sample_rate)
+
+# Recorder for the live session, None while not recording
+recorder = None
+record_start_time = 0.0  # time.perf_counter() when recording started
+record_frames = 0  # Frames handed to the recorder so far
+record_silence = np.zeros(block_size, dtype=np.float32)
+record_job = None  # Pending root.after job of record_tick
+
+# Pending root.after job that starts the next block, None while silent
+tone_job = None
+block_start_time = 0.0  # time.perf_counter() when the latest block started playing
+render_lead_ms = 10  # Render each block this long before the previous one ends
+
 # Initialize audio_samples with silence
-audio_samples = np.zeros(int(sample_rate * duration_ms / 1000), dtype=np.int16)
+audio_samples = np.zeros(block_size, dtype=np.float32)
+
+
+# Function to render the next float32 block from the current slider settings
+def render_block():
+    # Get the amplitude, frequency, waveform type, and pulse width from the sliders
+    amplitude = amplitude_slider.get()
+    frequency = get_note_frequency()
+    waveform_type = waveform_var.get()
+    pulse_width = pulse_width_slider.get() / 100.0  # Convert pulse width to a fraction
+
+    cutoff_frequency = cutoff_frequency_slider.get() if cutoff_enabled else None
+
+    # Generate the waveform, apply the filter (oversampled if enabled) and the ADSR envelope
+    if synth.voice.oversampling != oversampling_var.get():
+        synth.voice.set_oversampling(oversampling_var.get())
+    return synth.render(block_size, frequency, amplitude, waveform_type, pulse_width, cutoff_frequency)
 
 
 # Function to generate and play the drone sound
 def toggle_oscillator():
-    global oscillator_on, play_obj, audio_samples, cutoff_frequency
+    global oscillator_on
 
-    # If the oscillator is currently on, stop it
+    # If the oscillator is currently on, release the note; blocks keep
+    # playing until the release has finished
     if oscillator_on:
-        play_obj.stop()
+        synth.note_off()
         oscillator_on = False
-        plt.clf()  # Clear the oscilloscope plot
     else:
-        # Get the amplitude, frequency, waveform type, and pulse width from the sliders
-        amplitude = amplitude_slider.get()
-        frequency = get_note_frequency()
-        waveform_type = waveform_var.get()
-        pulse_width = pulse_width_slider.get() / 100.0  # Convert pulse width to a fraction
-
-        # Calculate the time array
-        t = np.linspace(0, duration_ms / 1000, int(sample_rate * duration_ms / 1000), endpoint=False)
-
-        # Inside the toggle_oscillator function
+        # Read the ADSR envelope from the sliders
         attack_time = attack_slider.get() / 1000.0  # Convert to seconds
         decay_time = decay_slider.get() / 1000.0  # Convert to seconds
         sustain_level = sustain_slider.get() / 100.0  # Convert to a fraction
         release_time = release_slider.get() / 1000.0  # Convert to seconds
+        synth.set_envelope(attack_time, decay_time, sustain_level, release_time)
 
-        # Calculate the total duration of the ADSR envelope
-        total_duration = attack_time + decay_time + release_time
-
-        # Create the ADSR envelope
-        envelope = np.zeros_like(t)
-        envelope[:int(attack_time * sample_rate)] = np.linspace(0, 1, int(attack_time * sample_rate))
-        envelope[int(attack_time * sample_rate):int((attack_time + decay_time) * sample_rate)] = np.linspace(1, sustain_level, int(decay_time * sample_rate))
-        envelope[int((attack_time + decay_time) * sample_rate):int((duration_ms / 1000) * sample_rate - release_time * sample_rate)] = sustain_level
-        envelope[int((duration_ms / 1000) * sample_rate - release_time * sample_rate):] = np.linspace(sustain_level, 0, int(release_time * sample_rate))
-
-        # Apply the envelope to the audio samples and convert envelope to int16
-        audio_samples = (audio_samples * envelope).astype(np.int16)
-
-
-        # Create the selected waveform (including pulse width for square wave)
-        if waveform_type == "Sine":
-            wave_func = lambda t: amplitude * np.sin(2 * np.pi * frequency * t)
-        elif waveform_type == "Triangle":
-            wave_func = lambda t: amplitude * (2 * np.abs(2 * frequency * t - 1) - 1)
-        elif waveform_type == "Sawtooth":
-            wave_func = lambda t: amplitude * (2 * (frequency * t - np.floor(0.5 + frequency * t)))
-        elif waveform_type == "Square":
-            wave_func = lambda t: amplitude * (np.floor(2 * frequency * t + pulse_width) % 2)
-
-        # Generate the waveform
-        audio_samples = (wave_func(t) * 32767).astype(np.int16)
-
-        # Apply the filter
-        audio_samples = signal.lfilter(b, a, audio_samples)
-
-        # Play the audio using simpleaudio
-        play_obj = sa.play_buffer(audio_samples, 1, 2, sample_rate)
+        # Start the note from a clean voice state
+        if waveform_var.get() == "Sampler":
+            sampler.set_instrument(get_instrument(sample_var.get(), loop_var.get()))
+        synth.note_on(get_note_frequency(), waveform_var.get())
         oscillator_on = True
 
-        # Update the tone continuously while the oscillator is on
-        update_tone()
+        # Update the tone continuously, unless the previous note is still releasing
+        if tone_job is None:
+            update_tone()
 
 # Function to update the tone and oscilloscope plot
 def update_tone():
-    global oscillator_on, cutoff_frequency, cutoff_enabled
-
-    if oscillator_on:
-        # Get the updated amplitude, frequency, waveform type, and pulse width from the sliders
-        amplitude = amplitude_slider.get()
-        frequency = get_note_frequency()
-        waveform_type = waveform_var.get()
-        pulse_width = pulse_width_slider.get() / 100.0  # Convert pulse width to a fraction
-
-        # Calculate the time array
-        t = np.linspace(0, duration_ms / 1000, int(sample_rate * duration_ms / 1000), endpoint=False)
-
-        # Create the selected waveform (including pulse width for square wave)
-        if waveform_type == "Sine":
-            wave_func = lambda t: amplitude * np.sin(2 * np.pi * frequency * t)
-        elif waveform_type == "Triangle":
-            wave_func = lambda t: amplitude * (2 * np.abs(2 * frequency * t - 1) - 1)
-        elif waveform_type == "Sawtooth":
-            wave_func = lambda t: amplitude * (2 * (frequency * t - np.floor(0.5 + frequency * t)))
-        elif waveform_type == "Square":
-            wave_func = lambda t: amplitude * (np.floor(2 * frequency * t + pulse_width) % 2)
-
-        # Generate the updated waveform
-        audio_samples = (wave_func(t) * 32767).astype(np.int16)
-
-        if cutoff_enabled:
-            # Calculate the updated filter coefficients
-            cutoff_frequency = cutoff_frequency_slider.get()
-            nyquist_frequency = 0.5 * sample_rate
-            b, a = signal.butter(1, cutoff_frequency / nyquist_frequency, btype='low', analog=False)
-
-            # Apply the filter
-            audio_samples = signal.lfilter(b, a, audio_samples)
-
-        # Update the audio being played
-        play_obj = sa.play_buffer(audio_samples, 1, 2, sample_rate)
+    global play_obj, audio_samples, tone_job, record_frames, block_start_time
+
+    if oscillator_on or synth.is_active():
+        audio_samples = render_block()
+
+        # Convert once to the output format
+        output_stage.set_format(output_format_var.get())
+        output_stage.dither = dither_var.get()
+
+        # Start the block when the previous one ends, or at once for the first
+        # block and after falling more than a block behind
+        block_end_time = block_start_time + duration_ms / 1000
+        now = time.perf_counter()
+        if tone_job is None or block_end_time < now - duration_ms / 1000:
+            block_end_time = now
+        time.sleep(max(block_end_time - now, 0))
+        block_start_time = block_end_time
+        play_obj = output_stage.play(sa, audio_samples, sample_rate)
+
+        statistics = output_stage.statistics()
+        clip_label.config(text="Clipped: %d  Peak: %.2f" % (statistics['clipped_samples'], statistics['peak']))
+
+        # Hand the block to the spectrum analyzer
+        analyzer.write(audio_samples)
+
+        # Hand a copy of the block to the recorder's background writer,
+        # placed at the time it starts playing
+        if recorder is not None:
+            record_until_now()
+            recorder.push(audio_samples)
+            record_frames += block_size
+            record_label.config(text="Recording %s  Dropped blocks: %d" % (recorder.sample_format, recorder.dropped_blocks))
 
         # Plot the waveform on the oscilloscope
         plt.clf()
@@ -160,8 +192,14 @@ def update_tone():
         plt.title("Oscilloscope")
         canvas.draw()
 
-        # Schedule the next update
-        root.after(1, update_tone)  # Update every millisecond
+        # Render the next block shortly before this one ends. The time is
+        # counted from this block's start rather than polled from the stream,
+        # so the block period holds whatever the render and plot times are.
+        next_render_ms = (block_start_time - time.perf_counter()) * 1000 + duration_ms - render_lead_ms
+        tone_job = root.after(max(int(next_render_ms), 1), update_tone)
+    else:
+        tone_job = None
+        plt.clf()  # Clear the oscilloscope plot
 
 
 # Create the main window
@@ -230,6 +268,13 @@ release_slider = tk.Scale(adsr_frame, from_=0, to=1000, resolution=1, orient="ho
 release_slider.set(100)
 release_slider.pack(side="left", padx=0)
 
+# Function to switch the sampler to the selected sample while playing,
+# like changing the waveform of the oscillator
+def change_sample_instrument():
+    if oscillator_on and waveform_var.get() == "Sampler":
+        sampler.set_instrument(get_instrument(sample_var.get(), loop_var.get()))
+        retrigger_sampler()
+
 # Waveform selection
 waveform_frame = tk.Frame(root)
 waveform_frame.pack(pady=10)
@@ -243,11 +288,59 @@ sine_radio = tk.Radiobutton(waveform_frame, text="Sine", variable=waveform_var,
 triangle_radio = tk.Radiobutton(waveform_frame, text="Triangle", variable=waveform_var, value="Triangle")
 sawtooth_radio = tk.Radiobutton(waveform_frame, text="Sawtooth", variable=waveform_var, value="Sawtooth")
 square_radio = tk.Radiobutton(waveform_frame, text="Square", variable=waveform_var, value="Square")
+sampler_radio = tk.Radiobutton(waveform_frame, text="Sampler", variable=waveform_var, value="Sampler", command=change_sample_instrument)
 
 sine_radio.pack(side="left", padx=10)
 triangle_radio.pack(side="left", padx=10)
 sawtooth_radio.pack(side="left", padx=10)
 square_radio.pack(side="left", padx=10)
+sampler_radio.pack(side="left", padx=10)
+
+# Sample selection for the sampler voice type
+sample_frame = tk.Frame(root)
+sample_frame.pack(pady=0)
+
+sample_label = tk.Label(sample_frame, text="Sample:")
+sample_label.pack(side="left", padx=5)
+
+sample_var = tk.StringVar(value=sample_names[0])
+sample_menu = tk.OptionMenu(sample_frame, sample_var, *sample_names, command=lambda name: change_sample_instrument())
+sample_menu.pack(side="left", padx=5)
+
+loop_var = tk.BooleanVar(value=False)
+loop_check = tk.Checkbutton(sample_frame, text="Loop", variable=loop_var, command=change_sample_instrument)
+loop_check.pack(side="left", padx=5)
+
+# Oversampling selection for the oscillator and filter stage
+oversampling_frame = tk.Frame(root)
+oversampling_frame.pack(pady=0)
+
+oversampling_label = tk.Label(oversampling_frame, text="Oversampling:")
+oversampling_label.pack(side="left", padx=5)
+
+oversampling_var = tk.IntVar(value=1)
+
+for factor in oversampling_factors:
+    oversampling_radio = tk.Radiobutton(oversampling_frame, text="%dx" % factor, variable=oversampling_var, value=factor)
+    oversampling_radio.pack(side="left", padx=10)
+
+# Output format, dither and clip statistics
+output_frame = tk.Frame(root)
+output_frame.pack(pady=0)
+
+output_format_label = tk.Label(output_frame, text="Output:")
+output_format_label.pack(side="left", padx=5)
+
+output_format_var = tk.StringVar(value="int16")
+output_format_menu = tk.OptionMenu(output_frame, output_format_var, *output_formats)
+output_format_menu.pack(side="left", padx=5)
+
+dither_var = tk.BooleanVar(value=True)
+dither_check = tk.Checkbutton(output_frame, text="Dither", variable=dither_var)
+dither_check.pack(side="left", padx=5)
+
+clip_label = tk.Label(output_frame, text="Clipped: 0  Peak: 0.00")
+clip_label.pack(side="left", padx=5)
 
 # Create a frame for the cutoff frequency controls
 cutoff_frame = tk.Frame(root)
@@ -267,10 +360,12 @@ cutoff_frequency_slider = tk.Scale(filter_frame, from_=1, to=20000, resolution=1
 cutoff_frequency_slider.set(10000)  # Set an initial cutoff frequency
 cutoff_frequency_slider.pack(side="left", padx=10)
 
-# Initialize the filter with an initial cutoff frequency
-cutoff_frequency = cutoff_frequency_slider.get()
-nyquist_frequency = 0.5 * sample_rate
-b, a = signal.butter(1, cutoff_frequency / nyquist_frequency, btype='low', analog=False)
+# Function to retrigger the sampler when the note changes while playing,
+# the previous note keeps sounding through its release
+def retrigger_sampler():
+    if oscillator_on and waveform_var.get() == "Sampler" and get_note_frequency():
+        sampler.note_off()
+        sampler.note_on(get_note_frequency())
 
 # Function to handle octave change
 def change_octave(direction):
@@ -280,12 +375,14 @@ def change_octave(direction):
     elif direction == 'down':
         octave -= 1
     frequency_slider.set(get_note_frequency())
+    retrigger_sampler()
 
 # Function to handle notes change
 def change_notes(note):
     global selected_note
     selected_note = note
     frequency_slider.set(get_note_frequency())
+    retrigger_sampler()
 
 # Function to handle key presses
 def handle_key(event):
@@ -334,6 +431,56 @@ generate_button = tk.Button(root, text="Toggle Oscillator", command=toggle_oscil
 generate_button.pack(pady=10)
 
 
+# Function to fill the recording with silence up to the current time, so
+# the file follows the wall clock even while nothing is playing
+def record_until_now():
+    global record_frames
+    due_frames = int((time.perf_counter() - record_start_time) * sample_rate) - record_frames
+    while due_frames > 0:
+        count = min(due_frames, block_size)
+        recorder.push(record_silence[:count])
+        record_frames += count
+        due_frames -= count
+
+# Function to keep the recording in step with the clock while recording
+def record_tick():
+    global record_job
+    if tone_job is None:
+        record_until_now()
+    record_label.config(text="Recording %s  Dropped blocks: %d" % (recorder.sample_format, recorder.dropped_blocks))
+    record_job = root.after(duration_ms, record_tick)
+
+# Function to start or stop recording the session to a file
+def toggle_recording():
+    global recorder, record_start_time, record_frames
+    if recorder is not None:
+        root.after_cancel(record_job)
+        record_until_now()
+        recorder.stop()
+        record_label.config(text="Saved %.1f s  Dropped blocks: %d" % (recorder.recorded_frames / sample_rate, recorder.dropped_blocks))
+        recorder = None
+    else:
+        extension = default_extension()
+        path = filedialog.asksaveasfilename(defaultextension=extension, filetypes=[("Audio", "*" + extension)])
+        if path:
+            # Record in the playback format; float32 falls back to int24 where the file cannot hold it
+            recorder = Recorder(path, sample_rate, sample_format=output_format_var.get(), dither=dither_var.get())
+            recorder.start()
+            record_start_time = time.perf_counter()
+            record_frames = 0
+            record_tick()
+
+# Record button and status
+record_frame = tk.Frame(root)
+record_frame.pack()
+
+record_button = tk.Button(record_frame, text="Record", command=toggle_recording)
+record_button.pack(side="left")
+
+record_label = tk.Label(record_frame, text="Not recording")
+record_label.pack(side="left", padx=10)
+
+
 # Create a frame for the oscilloscope
 oscilloscope_frame = tk.Frame(root)
 oscilloscope_frame.pack(pady=10)
@@ -356,6 +503,59 @@ oscilloscope_button = tk.Button(root, text="Hide/Show Oscilloscope", command=tog
 oscilloscope_button.pack()
 
 
+# Create a frame for the spectrum analyzer
+spectrum_frame = tk.Frame(root)
+
+# The spectrum figure is created outside pyplot so plt.clf() never touches it
+spectrum_fig = Figure(figsize=(6, 4))
+spectrum_canvas = FigureCanvasTkAgg(spectrum_fig, master=spectrum_frame)
+spectrum_canvas.get_tk_widget().pack()
+
+spectrum_axes = spectrum_fig.add_subplot(2, 1, 1)
+spectrum_line, = spectrum_axes.plot(analyzer.frequencies, analyzer.spectrum)
+spectrum_axes.set_xlim(0, sample_rate / 2)
+spectrum_axes.set_ylim(floor_db, 0)
+spectrum_axes.set_ylabel("Level (dB)")
+spectrum_axes.set_title("Spectrum")
+
+spectrogram_axes = spectrum_fig.add_subplot(2, 1, 2)
+history_seconds = analyzer.spectrogram.shape[1] * analyzer.hop / sample_rate
+spectrogram_image = spectrogram_axes.imshow(analyzer.spectrogram, origin='lower', aspect='auto', vmin=floor_db, vmax=0,
+                                            extent=(-history_seconds, 0, 0, sample_rate / 2))
+spectrogram_axes.set_xlabel("Time (s)")
+spectrogram_axes.set_ylabel("Frequency (Hz)")
+spectrum_fig.tight_layout()
+
+
+# Number of analyzed frames already shown, to skip redraws when nothing changed
+spectrum_frames_drawn = 0
+
+# Function to redraw the spectrum view from the analyzer's latest results
+def update_spectrum():
+    global spectrum_frames_drawn
+    if spectrum_frame.winfo_ismapped() and analyzer.frames_analyzed != spectrum_frames_drawn:
+        spectrum_frames_drawn = analyzer.frames_analyzed
+        spectrum_line.set_ydata(analyzer.spectrum)
+        spectrogram_image.set_data(analyzer.spectrogram)
+        spectrum_canvas.draw_idle()
+    root.after(int(1000 / max_analysis_rate), update_spectrum)
+
+
+# Function to toggle the visibility of the spectrum analyzer
+def toggle_spectrum():
+    if spectrum_frame.winfo_ismapped():
+        spectrum_frame.pack_forget()
+    else:
+        spectrum_frame.pack(pady=10)
+
+# Create a button for hiding/showing the spectrum analyzer
+spectrum_button = tk.Button(root, text="Hide/Show Spectrum", command=toggle_spectrum)
+spectrum_button.pack()
+
+analyzer.start()
+update_spectrum()
+
+
 # Bind keys to notes
 root.bind('a', lambda event: change_notes('C'))
 root.bind('s', lambda event: change_notes('D'))
@@ -388,11 +588,17 @@ def create_help_tab():
     - Use the 'Pulse Width' slider to control the pulse width for square waveforms.
     - Use the 'Attack', 'Decay', 'Sustain', and 'Release' sliders to shape the envelope.
     - Choose a waveform type (Sine, Triangle, Sawtooth, Square) using the radio buttons.
+    - Choose 'Sampler' to play a drum machine sample across the keyboard, optionally looped.
+    - Choose an oversampling factor (1x, 2x, 4x, 8x) to reduce aliasing at high pitches.
+    - Choose the output format (int16, int24, float32) and whether to add dither.
     - Toggle the 'Cutoff Frequency' filter using the button.
     - Octave Up and Octave Down buttons change the selected octave.
     - Notes buttons (C, D, E, F, G, A, B) select a note.
     - Press the corresponding letter keys (a, s, d, f, g, h, j) for notes.
     - Press 'Space' to toggle the oscillator on and off.
+    - Use 'Hide/Show Spectrum' to see the spectrum and a scrolling spectrogram.
+    - Use the 'Record' button to save what you play to a WAV (or FLAC) file.
+      Recordings use the output format and dither chosen above.
     - Press 'q' for Sine waveform, 'w' for Triangle, 'e' for Sawtooth, 'r' for Square.
     - Press 't' to toggle the Cutoff Frequency filter on and off.
     
@@ -488,8 +694,25 @@ def create_how_tab():
     how_label.pack()
     
 
+# Function to create the Oversampling Cost tab
+def create_oversampling_cost_tab():
+    cost_window = tk.Toplevel(root)
+    cost_window.title("Oversampling Cost")
+
+    cost_text = oversampling_cost_report(measure_oversampling_cost(sample_rate))
+
+    cost_label = tk.Label(cost_window, text=cost_text, justify="left", padx=20, pady=20)
+    cost_label.pack()
+
+
 def exit_application():
+    analyzer.stop()
+    if recorder is not None:
+        recorder.stop()
     root.destroy()
+
+# Closing the window must also stop the recorder, or the WAV header is never written
+root.protocol("WM_DELETE_WINDOW", exit_application)
     
 # Create a menu bar
 menu_bar = tk.Menu(root)
@@ -506,6 +729,7 @@ menu_bar.add_cascade(label="Help", menu=help_menu)
 help_menu.add_command(label="Help", command=create_help_tab)
 help_menu.add_command(label="About", command=create_about_tab)
 help_menu.add_command(label="How", command=create_how_tab)
+help_menu.add_command(label="Oversampling Cost", command=create_oversampling_cost_tab)
 
 # Start the GUI main loop
 root.mainloop()
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The synth modules are plain scripts next to this directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def pytest_addoption(parser):
+    parser.addoption('--update-golden', action='store_true', default=False,
+                     help="Rewrite the stored reference outputs instead of comparing against them")
@@ -0,0 +1,324 @@
+import os
+import numpy as np
+import pytest
+
+import dsp
+from analyzer import SpectrumAnalyzer
+
+# Reference outputs live next to the tests; regenerate them with
+#   python -m pytest sound_machine/synth/tests --update-golden
+# after a change that is meant to alter the sound, and review the diff.
+golden_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden', 'dsp_golden.npz')
+samples_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'drum')
+
+sample_rate = 48000
+waveforms = ("Sine", "Triangle", "Sawtooth", "Square")
+block_sizes = (1, 64, 333, 480, 4800)
+sequence_length = 4800
+
+
+# Function to render a component block by block and join the blocks
+def render_blocks(render, block_size, length=sequence_length):
+    blocks = []
+    for start in range(0, length, block_size):
+        blocks.append(np.array(render(min(block_size, length - start), start)))
+    return np.concatenate(blocks)
+
+
+# Function to build the oscillator patch used by the golden and block tests
+def oscillator_patch(waveform_type, oversampling, cutoff_frequency=8000):
+    voice = dsp.SynthVoice(sample_rate, oversampling)
+
+    # The pitch jumps at sample 2000 to check the phase carries over
+    def render_part(n, start):
+        return voice.render(n, 1975.53 if start < 2000 else 523.25, 0.5, waveform_type, 0.3, cutoff_frequency).copy()
+
+    def render(n, start):
+        if not start < 2000 < start + n:
+            return render_part(n, start)
+        split = 2000 - start
+        return np.concatenate((render_part(split, start), render_part(n - split, 2000)))
+    return render
+
+
+# Function to build an envelope that is released at sample 3000
+def envelope_patch():
+    envelope = dsp.ADSREnvelope(sample_rate)
+    envelope.set_parameters(0.005, 0.02, 0.6, 0.02)
+    envelope.note_on()
+
+    def render(n, start):
+        if not start <= 3000 < start + n:
+            return envelope.render(n)
+        # Split the block at the note off, as a key release would
+        split = 3000 - start
+        output = np.zeros(n, dtype=np.float32)
+        output[:split] = envelope.render(split)
+        envelope.note_off()
+        output[split:] = envelope.render(n - split)
+        return output
+    return render
+
+
+# Function to build the synth2 signal chain: voice, then envelope
+def synth_patch(waveform_type):
+    voice = dsp.SynthVoice(sample_rate, 2)
+    envelope_render = envelope_patch()
+
+    def render(n, start):
+        samples = voice.render(n, 220.0, 0.8, waveform_type, 0.5, 3000).copy()
+        samples *= envelope_render(n, start)
+        return samples
+    return render
+
+
+# Function to build a polyphonic sampler playing a drum sample
+def sampler_patch(name, looped=False, cached=False):
+    rate, data = dsp.load_sample(os.path.join(samples_directory, name))
+    instrument = dsp.SampleInstrument(data, rate)
+    if looped:
+        instrument.set_loop(len(data) // 4, len(data) // 2)
+    if cached:
+        instrument.precompute([392.0, 659.25], sample_rate)
+    sampler = dsp.Sampler(instrument, sample_rate, num_voices=2)
+    sampler.set_envelope(0.002, 0.01, 0.7, 0.01)
+
+    def render(n, start):
+        output = np.zeros(n, dtype=np.float32)
+        position = 0
+        # Notes start and stop at fixed samples, whatever the block size
+        for event_time, event in ((0, 392.0), (1500, 659.25), (3500, None)):
+            if start <= event_time < start + n and event_time >= start + position:
+                split = event_time - start
+                output[position:split] = sampler.render(split - position, 0.5, 6000)
+                position = split
+                if event is None:
+                    sampler.note_off()
+                else:
+                    sampler.note_on(event)
+        output[position:] = sampler.render(n - position, 0.5, 6000)
+        return output
+    return render
+
+
+# Every case renders a fixed patch or sequence from scratch
+golden_cases = {}
+for waveform_type in waveforms:
+    for oversampling in (1, 4):
+        golden_cases['oscillator_%s_%dx' % (waveform_type.lower(), oversampling)] = (
+            lambda waveform_type=waveform_type, oversampling=oversampling: oscillator_patch(waveform_type, oversampling))
+golden_cases['envelope'] = envelope_patch
+golden_cases['synth_sawtooth'] = lambda: synth_patch("Sawtooth")
+golden_cases['synth_square'] = lambda: synth_patch("Square")
+for name in ('sound_a.wav', 'sound_s.wav', 'sound_d.wav'):
+    golden_cases['sampler_%s' % name[:-4]] = lambda name=name: sampler_patch(name)
+golden_cases['sampler_sound_d_looped'] = lambda: sampler_patch('sound_d.wav', looped=True)
+
+# Components rendered with fixed inputs in render_golden()
+golden_components = ['decimator_2x', 'decimator_4x', 'decimator_8x',
+                     'output_int16', 'output_int24', 'output_float32', 'spectrum_sawtooth']
+golden_names = sorted(list(golden_cases) + golden_components)
+
+
+# Function to render every golden case plus the components with fixed inputs
+def render_golden():
+    outputs = {name: render_blocks(patch(), 480) for name, patch in golden_cases.items()}
+
+    for factor in (2, 4, 8):
+        impulse = np.zeros(256 * factor, dtype=np.float32)
+        impulse[0] = 1
+        outputs['decimator_%dx' % factor] = dsp.PolyphaseDecimator(factor).process(impulse).copy()
+
+    ramp = np.linspace(-1.5, 1.5, 1000, dtype=np.float32)
+    outputs['output_int16'] = dsp.OutputStage('int16', dither=True, seed=1234).process(ramp).copy()
+    outputs['output_int24'] = dsp.OutputStage('int24', dither=False).process(ramp).copy()
+    outputs['output_float32'] = dsp.OutputStage('float32').process(ramp).copy()
+
+    analyzer = SpectrumAnalyzer(sample_rate)
+    analyzer.write(render_blocks(oscillator_patch("Sawtooth", 4), 480))
+    analyzer.process()
+    outputs['spectrum_sawtooth'] = analyzer.spectrum.copy()
+    return outputs
+
+
+@pytest.fixture(scope='module')
+def golden(request):
+    outputs = render_golden()
+    if request.config.getoption('--update-golden'):
+        os.makedirs(os.path.dirname(golden_path), exist_ok=True)
+        np.savez_compressed(golden_path, **outputs)
+    with np.load(golden_path) as stored:
+        return outputs, dict(stored)
+
+
+def test_golden_cases_are_all_stored(golden):
+    outputs, stored = golden
+    assert sorted(outputs) == golden_names
+    assert sorted(stored) == golden_names
+
+
+@pytest.mark.parametrize('name', golden_names)
+def test_matches_golden_output(golden, name):
+    outputs, stored = golden
+    assert outputs[name].dtype == stored[name].dtype
+    if outputs[name].dtype.kind == 'f':
+        # Small slack for libm and BLAS differences between machines
+        np.testing.assert_allclose(outputs[name], stored[name], rtol=0, atol=1e-5 if name.startswith('spectrum') else 1e-6)
+    else:
+        np.testing.assert_allclose(outputs[name].astype(np.int64), stored[name].astype(np.int64), rtol=0, atol=1)
+
+
+@pytest.mark.parametrize('name', sorted(golden_cases))
+@pytest.mark.parametrize('block_size', block_sizes)
+def test_bit_exact_across_block_sizes(name, block_size):
+    reference = render_blocks(golden_cases[name](), sequence_length)
+    np.testing.assert_array_equal(render_blocks(golden_cases[name](), block_size), reference)
+
+
+@pytest.mark.parametrize('oversampling', dsp.oversampling_factors)
+def test_phase_continuous_across_blocks(oversampling):
+    frequency = 1000.0
+    voice = dsp.SynthVoice(sample_rate, oversampling)
+    sizes = [1, 7, 64, 333, 480, 95]
+    samples = np.concatenate([voice.render(n, frequency, 1.0, "Sine").copy() for n in sizes * 4])
+
+    # A sine can move at most 2*pi*f/fs per sample; a phase reset at a block
+    # boundary would jump much further
+    expected = np.sin(2 * np.pi * frequency * np.arange(len(samples)) / sample_rate)
+    largest_step = 2 * np.pi * frequency / sample_rate
+    if oversampling == 1:
+        np.testing.assert_allclose(samples, expected, atol=1e-6)
+        assert np.max(np.abs(np.diff(samples))) <= largest_step * 1.001
+    else:
+        # The decimation filter delays and slightly scales the sine
+        settled = samples[200:]
+        assert np.max(np.abs(np.diff(settled))) <= largest_step * 1.01
+
+
+def test_envelope_shapes_the_current_block():
+    envelope = dsp.ADSREnvelope(sample_rate)
+    envelope.set_parameters(0.01, 0.01, 0.5, 0.01)
+    envelope.note_on()
+    levels = envelope.render(2400)
+
+    attack = int(0.01 * sample_rate)
+    assert levels[0] == pytest.approx(1.0 / attack)
+    assert levels[attack - 1] == pytest.approx(1.0)
+    assert levels[2 * attack - 1] == pytest.approx(0.5)
+    assert np.all(levels[2 * attack:] == np.float32(0.5))
+
+    envelope.note_off()
+    release = envelope.render(attack + 10)
+    assert release[attack - 1] == 0
+    assert not envelope.is_active()
+
+
+@pytest.mark.parametrize('waveform_type', ("Sawtooth", "Sampler"))
+def test_synth_second_note_starts_from_silence(waveform_type):
+    rate, data = dsp.load_sample(os.path.join(samples_directory, 'sound_d.wav'))
+    instrument = dsp.SampleInstrument(data, rate)
+    instrument.set_loop(0, len(data))  # Keeps sounding until released
+    synth = dsp.Synth(sample_rate, dsp.Sampler(instrument, sample_rate))
+    synth.set_envelope(0.01, 0.05, 0.7, 0.1)
+
+    def render(n):
+        return synth.render(n, 220.0, 1.0, waveform_type).copy()
+
+    # Toggle on and off: the note keeps sounding through its 100 ms release
+    synth.note_on(220.0, waveform_type)
+    render(4800)
+    synth.note_off()
+    release = render(9600)
+    assert np.any(release[4000:4800] != 0)
+    assert np.all(release[4800:] == 0)
+    assert not synth.is_active()
+
+    # Toggle on again: the attack starts from 0, not from the sustain level
+    attack_step = 1.0 / (0.01 * sample_rate)
+    synth.note_on(220.0, waveform_type)
+    assert np.all(np.abs(render(4)) <= attack_step * np.arange(1, 5))
+
+    # Also when toggled on again in the middle of the release
+    render(4800)
+    synth.note_off()
+    render(480)
+    synth.note_on(220.0, waveform_type)
+    assert np.all(np.abs(render(4)) <= attack_step * np.arange(1, 5))
+
+
+def test_oversampling_reduces_aliasing():
+    frequency = 1975.53 * 4  # Top of the keyboard range after octave shifts
+
+    def alias_level(oversampling):
+        voice = dsp.SynthVoice(sample_rate, oversampling)
+        voice.render(4800, frequency, 0.5, "Sawtooth")  # Let the decimator settle
+        samples = voice.render(sample_rate, frequency, 0.5, "Sawtooth").astype(np.float64)
+        spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
+        harmonics = np.zeros(len(spectrum), dtype=bool)
+        for k in range(1, int(sample_rate / 2 / frequency) + 1):
+            centre = int(round(k * frequency))
+            harmonics[centre - 5:centre + 6] = True
+        return spectrum[~harmonics].max() / spectrum.max()
+
+    assert alias_level(8) < alias_level(1) / 10
+
+
+def test_sampler_cache_matches_interpolation():
+    np.testing.assert_array_equal(render_blocks(sampler_patch('sound_a.wav', cached=True), 480),
+                                  render_blocks(sampler_patch('sound_a.wav'), 480))
+
+
+def test_sampler_plays_original_pitch_at_root():
+    rate, data = dsp.load_sample(os.path.join(samples_directory, 'sound_d.wav'))
+    instrument = dsp.SampleInstrument(data, rate)
+    voice = dsp.SamplerVoice(instrument, rate)
+    voice.envelope.set_parameters(0, 0, 1, 0)
+    voice.note_on(instrument.root_frequency)
+    np.testing.assert_allclose(voice.render(1000, 1.0), data[:1000], atol=1e-6)
+
+
+@pytest.mark.parametrize('cached', (False, True))
+def test_sampler_loop_wraps_toward_loop_start(cached):
+    # A ramp played at half speed reads every half sample; across the wrap
+    # the voice must blend the last sample into the first, not into silence
+    instrument = dsp.SampleInstrument(np.arange(1, 11, dtype=np.float32), sample_rate // 2, loop_start=0, loop_end=10)
+    if cached:
+        instrument.precompute([instrument.root_frequency], sample_rate)
+    voice = dsp.SamplerVoice(instrument, sample_rate)
+    voice.envelope.set_parameters(0, 0, 1, 0)
+    voice.note_on(instrument.root_frequency)
+    output = voice.render(40, 1.0)
+    assert output[19] == pytest.approx(5.5)
+    assert output[20] == pytest.approx(1.0)
+    assert output[39] == pytest.approx(5.5)
+
+
+def test_sampler_frees_voices_after_release():
+    render = sampler_patch('sound_d.wav', looped=True)
+    output = render_blocks(render, 480, 8000)
+    assert np.all(output[3500 + int(0.01 * sample_rate):] == 0)
+
+
+def test_output_stage_counts_clipping():
+    output_stage = dsp.OutputStage('int16', dither=False)
+    output = output_stage.process(np.array([0.0, 0.5, 1.0, 1.5, -2.0], dtype=np.float32))
+    np.testing.assert_array_equal(output, [0, 16384, 32767, 32767, -32768])
+    statistics = output_stage.statistics()
+    assert statistics['clipped_samples'] == 2
+    assert statistics['peak'] == 2.0
+    assert statistics['total_samples'] == 5
+
+
+@pytest.mark.parametrize('output_format', sorted(dsp.output_formats))
+def test_output_stage_accepts_empty_first_block(output_format):
+    output_stage = dsp.OutputStage(output_format)
+    assert len(output_stage.process(np.zeros(0, dtype=np.float32))) == 0
+    assert output_stage.statistics()['total_samples'] == 0
+
+
+def test_output_stage_dither_is_tpdf():
+    output_stage = dsp.OutputStage('int16', dither=True, seed=0)
+    output = output_stage.process(np.full(100000, 0.25 / 32767, dtype=np.float32)).astype(np.int64)
+    # Triangular noise of +/- 1 LSB spreads a quarter LSB over -1..1
+    assert set(np.unique(output)) <= {-1, 0, 1}
+    assert np.mean(output) == pytest.approx(0.25, abs=0.02)